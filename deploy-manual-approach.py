@@ -1,132 +1,94 @@
 #!/usr/bin/env python3
-import boto3
-import json
-import time
 import argparse
+import logging
 
-def create_or_update_stackset(cf, stackset_name, template_body):
-    """Create StackSet if it doesn't exist, or update if it does"""
-    try:
-        cf.describe_stack_set(StackSetName=stackset_name)
-        print(f"🔄 Updating StackSet {stackset_name} template...")
-        response = cf.update_stack_set(
-            StackSetName=stackset_name,
-            TemplateBody=template_body,
-            Capabilities=['CAPABILITY_IAM']
-        )
-        
-        # Wait for template update to complete
-        operation_id = response['OperationId']
-        print(f"⏳ Waiting for template update to complete...")
-        
-        max_attempts = 60
-        attempt = 0
-        
-        while attempt < max_attempts:
-            try:
-                operation = cf.describe_stack_set_operation(
-                    StackSetName=stackset_name,
-                    OperationId=operation_id
-                )
-                status = operation['StackSetOperation']['Status']
-                
-                if status in ['SUCCEEDED', 'FAILED', 'STOPPED']:
-                    if status == 'SUCCEEDED':
-                        print(f"✅ StackSet {stackset_name} template updated")
-                    else:
-                        print(f"❌ Template update {status}")
-                    break
-                
-                print(f"   Template update status: {status}")
-                time.sleep(10)
-                attempt += 1
-                
-            except Exception as e:
-                print(f"Error checking template update status: {e}")
-                break
+from stackset_deploy import (
+    build_operation_preferences,
+    create_or_update_stackset,
+    get_cf,
+    group_accounts,
+    list_stack_instance_accounts,
+    load_config,
+    log,
+    wait_for_stackset_op
+)
+
+# All accounts of a batch at once (soft failure tolerance), starting no more after the first failure
+BATCH_PREFERENCES = build_operation_preferences(max_concurrent=100, failure_tolerance=0)
+
+def _run_batches(cf, stackset_name, batches, submit, heading, delay=2):
+    """Submit one operation per batch of identically configured accounts and wait for each in turn"""
+    succeeded = set()
+    for index, batch in enumerate(batches):
+        # Skip accounts an earlier batch already handled
+        batch = [account for account in batch if account['accountId'] not in succeeded]
+        if not batch:
+            continue
+        batch_accounts = ', '.join(account['accountId'] for account in batch)
+        log.info(f"\n{heading} stack instances for {len(batch)} account(s):")
+        for account in batch:
+            account_name = account['_params']['AccountName']
+            log.info(f"   {account['accountId']} ({account_name})")
+        log.info(f"Region: {batch[0]['regions']}")
+        log.info(f"Parameter overrides: {batch[0]['parameters']}")
         
-        if attempt >= max_attempts:
-            print(f"⚠️ Timeout waiting for template update")
+        try:
+            response = submit(
+                StackSetName=stackset_name,
+                Accounts=[account['accountId'] for account in batch],
+                Regions=batch[0]['regions'],
+                ParameterOverrides=batch[0]['parameters'],
+                OperationPreferences=BATCH_PREFERENCES
+            )
+            
+            operation_id = response['OperationId']
+            log.info(f"✓ Operation initiated - Operation ID: {operation_id}")
+            
+            # Wait for this specific operation to complete (like the console does)
+            log.info("Waiting for operation to complete...")
             
-    except cf.exceptions.StackSetNotFoundException:
-        print(f"🔧 Creating StackSet {stackset_name}...")
-        cf.create_stack_set(
-            StackSetName=stackset_name,
-            TemplateBody=template_body,
-            Capabilities=['CAPABILITY_IAM'],
-            Description='Default StackSet'
-        )
-        print(f"✅ StackSet {stackset_name} created")
+            status = wait_for_stackset_op(cf, stackset_name, operation_id, delay=delay)
+            if status == 'SUCCEEDED':
+                log.info(f"✓ Operation succeeded for {batch_accounts}")
+                succeeded.update(account['accountId'] for account in batch)
+            elif status in ['FAILED', 'STOPPED']:
+                log.error(f"✗ Operation {status} for {batch_accounts}")
+            else:
+                # The operation is still running, so every later batch would be rejected
+                remaining = sum(len(pending) for pending in batches[index:])
+                log.warning(f"⚠️ Timeout waiting for operation {operation_id}")
+                log.warning(f"ℹ️ {remaining} account(s) still in progress or pending - run the script again once the operation finishes")
+                return
+            
+        except Exception as e:
+            log.error(f"✗ Error for {batch_accounts}: {str(e)}")
 
-def update_stack_instance(cf, stackset_name, config, target_account=None):
-    """Update existing stack instance (manual approach - one at a time)"""
+def update_stack_instance(cf, stackset_name, config, target_account=None, delay=2):
+    """Update existing stack instances, one operation per batch of identically configured accounts"""
     try:
-        existing_instances = cf.list_stack_instances(StackSetName=stackset_name)
-        existing_accounts = {instance['Account'] for instance in existing_instances['Summaries']}
+        existing_accounts = list_stack_instance_accounts(cf, stackset_name, target_account)
     except Exception as e:
-        print(f"❌ Error listing stack instances: {e}")
+        log.error(f"❌ Error listing stack instances: {e}")
         return
     
     if target_account:
         if target_account not in existing_accounts:
-            print(f"❌ Account {target_account} not found in existing stack instances")
+            log.error(f"❌ Account {target_account} not found in existing stack instances")
+            return
+        if target_account not in config['_by_id']:
+            log.error(f"❌ Account {target_account} not found in the account configuration")
             return
-        accounts_to_update = [acc for acc in config['accounts'] if acc['accountId'] == target_account]
+        accounts_to_update = [config['_by_id'][target_account]]
     else:
-        accounts_to_update = [acc for acc in config['accounts'] if acc['accountId'] in existing_accounts]
+        accounts_to_update = [acc for acc in config['_by_id'].values() if acc['accountId'] in existing_accounts]
         if not accounts_to_update:
-            print("❌ No existing stack instances found to update")
+            log.error("❌ No existing stack instances found to update")
             return
-        # For manual approach, update only the first account
-        accounts_to_update = [accounts_to_update[0]]
-    
-    account = accounts_to_update[0]
-    account_name = next(p['ParameterValue'] for p in account['parameters'] if p['ParameterKey'] == 'AccountName')
-    
-    print(f"🔄 Updating stack instance for account {account['accountId']} ({account_name})")
-    print(f"Region: {account['regions']}")
-    print(f"Parameter overrides: {account['parameters']}")
     
-    try:
-        response = cf.update_stack_instances(
-            StackSetName=stackset_name,
-            Accounts=[account['accountId']],
-            Regions=account['regions'],
-            ParameterOverrides=account['parameters']
-        )
-        
-        operation_id = response['OperationId']
-        print(f"✓ Stack instance update initiated - Operation ID: {operation_id}")
-        
-        print("Waiting for operation to complete...")
-        
-        for attempt in range(40):
-            try:
-                operation = cf.describe_stack_set_operation(
-                    StackSetName=stackset_name,
-                    OperationId=operation_id
-                )
-                status = operation['StackSetOperation']['Status']
-                print(f"Operation status: {status}")
-                
-                if status in ['SUCCEEDED', 'FAILED', 'STOPPED']:
-                    if status == 'SUCCEEDED':
-                        print(f"✓ Stack instance updated successfully for {account['accountId']}")
-                    else:
-                        print(f"✗ Operation {status} for {account['accountId']}")
-                    break
-                
-                time.sleep(15)
-            except Exception as e:
-                print(f"Error checking operation status: {e}")
-                break
-        
-    except Exception as e:
-        print(f"✗ Error updating {account['accountId']}: {str(e)}")
+    _run_batches(cf, stackset_name, group_accounts(accounts_to_update), cf.update_stack_instances, "🔄 Updating", delay)
 
-def deploy_manual_approach(profile_name, stackset_name, template_file, config_file):
-    session = boto3.Session(profile_name=profile_name)
-    cf = session.client('cloudformation')
+def deploy_manual_approach(profile_name, stackset_name, template_file, config_file, delay=2):
+    cf = get_cf(profile_name)
     
     # Load CloudFormation template
     with open(template_file, 'r') as f:
@@ -136,86 +98,27 @@ def deploy_manual_approach(profile_name, stackset_name, template_file, config_fi
     create_or_update_stackset(cf, stackset_name, template_body)
     
     # Load configuration
-    with open(config_file, 'r') as f:
-        config = json.load(f)
+    config = load_config(config_file)
     
     # Check existing instances
     try:
-        existing_instances = cf.list_stack_instances(StackSetName=stackset_name)
-        existing_accounts = {instance['Account'] for instance in existing_instances['Summaries']}
+        existing_accounts = list_stack_instance_accounts(cf, stackset_name)
     except Exception as e:
         existing_accounts = set()
     
     # Find accounts that need deployment
-    accounts_to_deploy = [account for account in config['accounts'] if account['accountId'] not in existing_accounts]
+    accounts_to_deploy = [account for account in config['_by_id'].values() if account['accountId'] not in existing_accounts]
     
-    print(f"StackSet Deployment Status:")
-    print(f"✓ Deployed: {len(existing_accounts)} accounts")
-    print(f"⏳ Remaining: {len(accounts_to_deploy)} accounts")
+    log.info(f"StackSet Deployment Status:")
+    log.info(f"✓ Deployed: {len(existing_accounts)} accounts")
+    log.info(f"⏳ Remaining: {len(accounts_to_deploy)} accounts")
     
     if not accounts_to_deploy:
-        print("\n🎉 All accounts have been deployed successfully!")
+        log.info("\n🎉 All accounts have been deployed successfully!")
         return
     
-    # Show next account to deploy
-    next_account = accounts_to_deploy[0]
-    account_name = next(p['ParameterValue'] for p in next_account['parameters'] if p['ParameterKey'] == 'AccountName')
-    print(f"\n🚀 Next deployment: {next_account['accountId']} ({account_name})")
-    
-    # Deploy only the first pending account
-    account = next_account
-    
-    account_name = next(p['ParameterValue'] for p in account['parameters'] if p['ParameterKey'] == 'AccountName')
-    print(f"\nAdding stack instance for account {account['accountId']} ({account_name})")
-    print(f"Region: {account['regions']}")
-    print(f"Parameter overrides: {account['parameters']}")
-    
-    try:
-        # This mimics the manual "Add stack instances" action
-        response = cf.create_stack_instances(
-            StackSetName=stackset_name,
-            Accounts=[account['accountId']],
-            Regions=account['regions'],
-            ParameterOverrides=account['parameters']
-        )
-        
-        operation_id = response['OperationId']
-        print(f"✓ Stack instance creation initiated - Operation ID: {operation_id}")
-        
-        # Wait for this specific operation to complete (like the console does)
-        print("Waiting for operation to complete...")
-        
-        # Poll operation status instead of using waiter
-        for attempt in range(40):
-            try:
-                operation = cf.describe_stack_set_operation(
-                    StackSetName=stackset_name,
-                    OperationId=operation_id
-                )
-                status = operation['StackSetOperation']['Status']
-                print(f"Operation status: {status}")
-                
-                if status in ['SUCCEEDED', 'FAILED', 'STOPPED']:
-                    if status == 'SUCCEEDED':
-                        print(f"✓ Stack instance deployed successfully to {account['accountId']}")
-                    else:
-                        print(f"✗ Operation {status} for {account['accountId']}")
-                    break
-                
-                time.sleep(15)
-            except Exception as e:
-                print(f"Error checking operation status: {e}")
-                break
-        
-    except Exception as e:
-        print(f"✗ Error deploying to {account['accountId']}: {str(e)}")
-    
-    # Show remaining accounts after this deployment
-    remaining_after = len(accounts_to_deploy) - 1
-    if remaining_after > 0:
-        print(f"\n📋 Run script again to deploy remaining {remaining_after} accounts")
-    else:
-        print(f"\n🎉 All accounts deployed successfully!")
+    # Deploy every pending account; this mimics the manual "Add stack instances" action
+    _run_batches(cf, stackset_name, group_accounts(accounts_to_deploy), cf.create_stack_instances, "🚀 Adding", delay)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Deploy or update CloudFormation StackSet instances (manual approach)')
@@ -226,30 +129,32 @@ if __name__ == "__main__":
     parser.add_argument('--stackset-name', type=str, default='Template', help='StackSet name (default: Template)')
     parser.add_argument('--template', type=str, default='Template.yaml', help='CloudFormation template file (default: Template.yaml)')
     parser.add_argument('--config', type=str, default='account-parameters.json', help='Account parameters config file (default: account-parameters.json)')
+    parser.add_argument('--poll-delay', type=int, default=2, help='Minimum seconds between operation status checks (default: 2)')
+    parser.add_argument('--log-level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='Logging level (default: INFO)')
     
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(message)s')
     
     if args.update:
-        session = boto3.Session(profile_name=args.profile)
-        cf = session.client('cloudformation')
+        cf = get_cf(args.profile)
         
         # Load CloudFormation template
         with open(args.template, 'r') as f:
             template_body = f.read()
         
         # Create or update StackSet (template changes auto-propagate to instances)
-        create_or_update_stackset(cf, args.stackset_name, template_body)
+        template_updated = create_or_update_stackset(cf, args.stackset_name, template_body)
         
         # Only update instances if specific account requested and update-params flag used
         if args.account and args.update_params:
-            with open(args.config, 'r') as f:
-                config = json.load(f)
-            print(f"🔄 Updating parameters for account: {args.account}")
-            update_stack_instance(cf, args.stackset_name, config, args.account)
+            config = load_config(args.config)
+            log.info(f"🔄 Updating parameters for account: {args.account}")
+            update_stack_instance(cf, args.stackset_name, config, args.account, args.poll_delay)
         elif args.account:
-            print(f"ℹ️ Template updated for StackSet. Use --update-params to also update parameters for account {args.account}")
+            log.info(f"ℹ️ Use --update-params to also update parameters for account {args.account}")
         else:
-            print("✅ Template updated - changes will propagate to all instances automatically")
-            print("ℹ️ Use --account and --update-params to update specific account parameters")
+            if template_updated:
+                log.info("✅ Template updated - changes will propagate to all instances automatically")
+            log.info("ℹ️ Use --account and --update-params to update specific account parameters")
     else:
-        deploy_manual_approach(args.profile, args.stackset_name, args.template, args.config)
\ No newline at end of file
+        deploy_manual_approach(args.profile, args.stackset_name, args.template, args.config, args.poll_delay)
\ No newline at end of file
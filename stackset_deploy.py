@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+import boto3
+import collections
+import json
+import os
+import time
+import random
+import argparse
+import logging
+import functools
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, WaiterError
+from botocore.waiter import WaiterModel, create_waiter_with_client
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+log = logging.getLogger('deploy')
+
+# Let botocore absorb throttling with client-side rate limiting instead of failing the call,
+# and keep enough pooled keep-alive connections for concurrent account updates
+CLIENT_CONFIG = Config(
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+    max_pool_connections=32,
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=30
+)
+
+# Error codes that mean "slow down" rather than a real failure
+THROTTLING_ERROR_CODES = ['Throttling', 'ThrottlingException', 'RequestLimitExceeded']
+
+# CloudFormation ships no StackSet operation waiter, so define one
+STACKSET_OPERATION_WAITER = WaiterModel({
+    'version': 2,
+    'waiters': {
+        'StackSetOperationComplete': {
+            'operation': 'DescribeStackSetOperation',
+            'delay': 5,
+            'maxAttempts': 240,
+            'acceptors': [
+                {'state': 'success', 'matcher': 'path', 'argument': 'StackSetOperation.Status', 'expected': 'SUCCEEDED'},
+                {'state': 'failure', 'matcher': 'path', 'argument': 'StackSetOperation.Status', 'expected': 'FAILED'},
+                {'state': 'failure', 'matcher': 'path', 'argument': 'StackSetOperation.Status', 'expected': 'STOPPED'}
+            ] + [
+                # Throttling that outlasts the client's own retries just means poll again later
+                {'state': 'retry', 'matcher': 'error', 'expected': code} for code in THROTTLING_ERROR_CODES
+            ]
+        }
+    }
+})
+
+# Re-list stack instances at least this often (seconds) as a safety net for the cached view
+RESYNC_INTERVAL = 600
+
+# Times a failed batch is requeued before the deploy loop gives up on it
+MAX_BATCH_RETRIES = 3
+
+# Exponential moving average of completed operation durations (seconds) per StackSet
+_op_duration_ema = {}
+EMA_ALPHA = 0.3
+
+# Longest blind sleep (seconds) before the first check, since the average spans operations of every size
+MAX_INITIAL_SLEEP = 60
+
+# Seconds to keep resubmitting while an operation started elsewhere is running on the StackSet
+SUBMIT_TIMEOUT = 1200
+
+def _backoff(attempt):
+    """Exponential polling delay (1.5x per attempt, 2s floor, 30s cap) with jitter"""
+    return max(2, min(30, (1.5 ** attempt) + random.uniform(0, 0.5)))
+
+@functools.lru_cache(maxsize=None)
+def get_cf(profile, region=None):
+    """Return a CloudFormation client, built once per profile and region"""
+    session = boto3.Session(profile_name=profile)
+    return session.client('cloudformation', region_name=region, config=CLIENT_CONFIG)
+
+def wait_for_stackset_op(cf, stackset_name, operation_id, delay=2, timeout=1200):
+    """Wait for a StackSet operation and return its last seen status"""
+    waiter = create_waiter_with_client('StackSetOperationComplete', STACKSET_OPERATION_WAITER, cf)
+    started = time.monotonic()
+    expected = _op_duration_ema.get(stackset_name)
+    if expected:
+        # Sleep through most of the usual duration, then poll quickly until twice the usual duration
+        time.sleep(min(expected * 0.8, MAX_INITIAL_SLEEP))
+    
+    status = None
+    attempt = 0
+    while True:
+        try:
+            # Single check per call so the delay between checks can back off
+            waiter.wait(
+                StackSetName=stackset_name,
+                OperationId=operation_id,
+                WaiterConfig={'MaxAttempts': 1}
+            )
+            break
+        except WaiterError as e:
+            # Failure states and pending checks carry the last describe response; other errors are real
+            response = e.last_response or {}
+            if 'StackSetOperation' in response:
+                status = response['StackSetOperation']['Status']
+                if status in ['FAILED', 'STOPPED']:
+                    return status
+            elif response.get('Error', {}).get('Code') not in THROTTLING_ERROR_CODES:
+                raise
+        
+        elapsed = time.monotonic() - started
+        if elapsed > timeout:
+            return status
+        if expected and elapsed < 2 * expected:
+            time.sleep(max(delay, 2))
+        else:
+            time.sleep(max(delay, _backoff(attempt)))
+            attempt += 1
+    
+    duration = time.monotonic() - started
+    if expected is None:
+        _op_duration_ema[stackset_name] = duration
+    else:
+        _op_duration_ema[stackset_name] = EMA_ALPHA * duration + (1 - EMA_ALPHA) * expected
+    return 'SUCCEEDED'
+
+def list_stack_instance_accounts(cf, stackset_name, account=None):
+    """Return the accounts that have stack instances, following every result page"""
+    kwargs = {'StackSetName': stackset_name, 'PaginationConfig': {'PageSize': 100}}
+    if account:
+        kwargs['StackInstanceAccount'] = account
+    paginator = cf.get_paginator('list_stack_instances')
+    return {summary['Account'] for page in paginator.paginate(**kwargs) for summary in page['Summaries']}
+
+@functools.lru_cache(maxsize=1)
+def _load_config(config_file, mtime):
+    """Parse the config file; mtime is only part of the cache key so edits are picked up"""
+    with open(config_file, 'rb') as f:
+        config = _loads(f.read())
+    for account in config['accounts']:
+        account['_params'] = {p['ParameterKey']: p['ParameterValue'] for p in account['parameters']}
+    # The first entry for an account ID wins, matching the original single-account update
+    config['_by_id'] = {}
+    for account in config['accounts']:
+        if account['accountId'] in config['_by_id']:
+            log.warning(f"⚠️ Account {account['accountId']} is listed more than once in {config_file} - using its first entry")
+            continue
+        config['_by_id'][account['accountId']] = account
+    return config
+
+def load_config(config_file):
+    """Load account configuration, indexing accounts by ID and their parameters by key"""
+    return _load_config(config_file, os.path.getmtime(config_file))
+
+def build_operation_preferences(max_concurrent=100, failure_tolerance=10):
+    """Build StackSet operation preferences deploying all regions in parallel"""
+    return {
+        'RegionConcurrencyType': 'PARALLEL',
+        'MaxConcurrentPercentage': max_concurrent,
+        'FailureTolerancePercentage': failure_tolerance,
+        # The default strict mode caps concurrency at the failure tolerance + 1, which
+        # rounds down to one account at a time for small batches
+        'ConcurrencyMode': 'SOFT_FAILURE_TOLERANCE'
+    }
+
+def create_or_update_stackset(cf, stackset_name, template_body, preferences=None):
+    """Create StackSet if it doesn't exist, or update if it does; return whether the template changed"""
+    if preferences is None:
+        preferences = build_operation_preferences()
+    
+    try:
+        stackset = cf.describe_stack_set(StackSetName=stackset_name)['StackSet']
+    except cf.exceptions.StackSetNotFoundException:
+        log.info(f"🔧 Creating StackSet {stackset_name}...")
+        cf.create_stack_set(
+            StackSetName=stackset_name,
+            TemplateBody=template_body,
+            Capabilities=['CAPABILITY_IAM'],
+            Description='Default StackSet'
+        )
+        log.info(f"✅ StackSet {stackset_name} created")
+        return True
+    
+    # Skip the update and its wait when the deployed template is already this one
+    if stackset['TemplateBody'] == template_body:
+        log.info("✅ Template unchanged, skipping update")
+        return False
+    
+    log.info(f"🔄 Updating StackSet {stackset_name} template...")
+    response = cf.update_stack_set(
+        StackSetName=stackset_name,
+        TemplateBody=template_body,
+        Capabilities=['CAPABILITY_IAM'],
+        OperationPreferences=preferences
+    )
+    
+    # Wait for template update to complete
+    operation_id = response['OperationId']
+    log.info(f"⏳ Waiting for template update to complete...")
+    
+    try:
+        status = wait_for_stackset_op(cf, stackset_name, operation_id)
+        if status == 'SUCCEEDED':
+            log.info(f"✅ StackSet {stackset_name} template updated")
+            return True
+        elif status in ['FAILED', 'STOPPED']:
+            log.error(f"❌ Template update {status}")
+        else:
+            log.warning(f"⚠️ Timeout waiting for template update")
+    except WaiterError as e:
+        log.error(f"Error checking template update status: {e}")
+    return False
+
+def _update_batch(cf, stackset_name, batch, preferences):
+    """Update stack instances for a batch of identically configured accounts and wait for the operation"""
+    deadline = time.monotonic() + SUBMIT_TIMEOUT
+    attempt = 0
+    while True:
+        try:
+            response = cf.update_stack_instances(
+                StackSetName=stackset_name,
+                Accounts=[account['accountId'] for account in batch],
+                Regions=batch[0]['regions'],
+                ParameterOverrides=batch[0]['parameters'],
+                OperationPreferences=preferences
+            )
+            break
+        except cf.exceptions.OperationInProgressException:
+            # Someone else's operation is running - back off and resubmit until it should be done
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(_backoff(attempt))
+            attempt += 1
+    
+    operation_id = response['OperationId']
+    log.info(f"✓ Update operation initiated: {operation_id}")
+    return wait_for_stackset_op(cf, stackset_name, operation_id)
+
+def update_stack_instances(cf, stackset_name, config, target_account=None, preferences=None):
+    """Update existing stack instances"""
+    if preferences is None:
+        preferences = build_operation_preferences()
+    
+    # Wait for any ongoing operations to complete
+    log.info("⏳ Checking for ongoing operations...")
+    max_wait_attempts = 30
+    wait_attempt = 0
+    
+    while wait_attempt < max_wait_attempts:
+        try:
+            operations = cf.list_stack_set_operations(StackSetName=stackset_name, MaxResults=1)
+            if operations['Summaries']:
+                latest_op = operations['Summaries'][0]
+                if latest_op['Status'] in ['RUNNING', 'STOPPING']:
+                    # Only announce the first poll of a busy period; repeats go to debug
+                    level = logging.INFO if wait_attempt == 0 else logging.DEBUG
+                    log.log(level, f"⏳ Operation {latest_op['OperationId']} is {latest_op['Status']} - waiting...")
+                    time.sleep(_backoff(wait_attempt))
+                    wait_attempt += 1
+                    continue
+            break
+        except (BotoCoreError, ClientError) as e:
+            if isinstance(e, ClientError) and e.response['Error']['Code'] in THROTTLING_ERROR_CODES:
+                time.sleep(_backoff(wait_attempt))
+                wait_attempt += 1
+                continue
+            log.error(f"Error checking operations: {e}")
+            break
+    
+    try:
+        # With a target account, let the API filter instead of listing every instance
+        existing_accounts = list_stack_instance_accounts(cf, stackset_name, target_account)
+    except Exception as e:
+        log.error(f"❌ Error listing stack instances: {e}")
+        return
+    
+    # Filter accounts to update
+    if target_account:
+        if target_account not in existing_accounts:
+            log.error(f"❌ Account {target_account} not found in existing stack instances")
+            return
+        if target_account not in config['_by_id']:
+            log.error(f"❌ Account {target_account} not found in the account configuration")
+            return
+        accounts_to_update = [config['_by_id'][target_account]]
+        log.info(f"🔄 Updating stack instance for account: {target_account}")
+    else:
+        accounts_to_update = [acc for acc in config['_by_id'].values() if acc['accountId'] in existing_accounts]
+        log.info(f"🔄 Updating {len(accounts_to_update)} stack instances...")
+    
+    # CloudFormation runs one operation per StackSet at a time, so update one batch of
+    # identically configured accounts per operation
+    for batch in group_accounts(accounts_to_update):
+        batch_accounts = ', '.join(account['accountId'] for account in batch)
+        log.info(f"🔄 Updating batch of {len(batch)} account(s):")
+        for account in batch:
+            account_name = account['_params']['AccountName']
+            log.info(f"   {account['accountId']} ({account_name})")
+        
+        try:
+            status = _update_batch(cf, stackset_name, batch, preferences)
+        except cf.exceptions.OperationInProgressException:
+            log.warning(f"⏳ Another operation still in progress for {batch_accounts} - skipping")
+            continue
+        except Exception as e:
+            log.error(f"❌ Error updating {batch_accounts}: {e}")
+            continue
+        
+        if status == 'SUCCEEDED':
+            log.info(f"✅ Successfully updated {batch_accounts}")
+        elif status in ['FAILED', 'STOPPED']:
+            log.error(f"❌ Update {status} for {batch_accounts}")
+        else:
+            log.warning(f"⚠️ Timeout waiting for update of {batch_accounts}")
+
+def group_accounts(accounts):
+    """Group accounts sharing identical regions and parameter overrides, preserving config order"""
+    groups = {}
+    for account in accounts:
+        key = (
+            tuple(account['regions']),
+            frozenset((p['ParameterKey'], p['ParameterValue']) for p in account['parameters'])
+        )
+        groups.setdefault(key, []).append(account)
+    return list(groups.values())
+
+def _drop_deployed(pending, existing_accounts):
+    """Remove deployed accounts from pending batches, dropping batches left empty"""
+    return collections.deque(
+        (batch, retries) for batch, retries in (
+            ([account for account in batch if account['accountId'] not in existing_accounts], retries)
+            for batch, retries in pending
+        ) if batch
+    )
+
+def deploy_auto_loop(cf, stackset_name, template_file, config_file, preferences=None):
+    if preferences is None:
+        preferences = build_operation_preferences()
+    
+    # Load CloudFormation template
+    with open(template_file, 'r') as f:
+        template_body = f.read()
+    
+    # Load configuration
+    config = load_config(config_file)
+    
+    # Create or update StackSet
+    create_or_update_stackset(cf, stackset_name, template_body, preferences)
+    
+    log.info("🔄 Starting automated StackSet deployment loop...")
+    # last_sync stays None until a listing succeeds, so the next pass retries it
+    existing_accounts = set()
+    last_sync = None
+    try:
+        existing_accounts = list_stack_instance_accounts(cf, stackset_name)
+        last_sync = time.monotonic()
+    except Exception as e:
+        log.error(f"Error listing stack instances: {e}")
+    
+    # Batches still to deploy, each paired with the number of times it has been retried
+    pending = collections.deque(
+        (batch, 0) for batch in group_accounts(
+            [account for account in config['_by_id'].values() if account['accountId'] not in existing_accounts]
+        )
+    )
+    given_up = []
+    wait_attempt = 0
+    last_completed_op_id = None
+    
+    while True:
+        # Re-list instances after failures and periodically, dropping accounts deployed elsewhere
+        if last_sync is None or time.monotonic() - last_sync > RESYNC_INTERVAL:
+            try:
+                existing_accounts = list_stack_instance_accounts(cf, stackset_name)
+                last_sync = time.monotonic()
+                pending = _drop_deployed(pending, existing_accounts)
+            except Exception as e:
+                log.error(f"Error listing stack instances: {e}")
+        
+        remaining = sum(len(batch) for batch, _ in pending)
+        log.info(f"\n📊 Status: ✓ {len(existing_accounts)} deployed | ⏳ {remaining} remaining")
+        
+        if not pending:
+            if given_up:
+                log.warning(f"⚠️ Gave up on {len(given_up)} account(s): {', '.join(account['accountId'] for account in given_up)}")
+            else:
+                log.info("🎉 All accounts deployed successfully!")
+            break
+        
+        # Check if any operation is in progress, unless our own last operation was seen finishing
+        if last_completed_op_id is None:
+            try:
+                operations = cf.list_stack_set_operations(StackSetName=stackset_name, MaxResults=1)
+                if operations['Summaries']:
+                    latest_op = operations['Summaries'][0]
+                    if latest_op['Status'] in ['RUNNING', 'STOPPING']:
+                        # Only announce the first poll of a busy period; repeats go to debug
+                        level = logging.INFO if wait_attempt == 0 else logging.DEBUG
+                        log.log(level, f"⏳ Operation {latest_op['OperationId']} is {latest_op['Status']} - waiting...")
+                        time.sleep(_backoff(wait_attempt))
+                        wait_attempt += 1
+                        continue
+                wait_attempt = 0
+            except (BotoCoreError, ClientError) as e:
+                if isinstance(e, ClientError) and e.response['Error']['Code'] in THROTTLING_ERROR_CODES:
+                    time.sleep(_backoff(wait_attempt))
+                    wait_attempt += 1
+                    continue
+                log.error(f"Error checking operations: {e}")
+        
+        last_completed_op_id = None
+        
+        # Deploy next batch of accounts sharing the same regions and parameters
+        batch, retries = pending.popleft()
+        log.info(f"🚀 Deploying batch of {len(batch)} account(s):")
+        for account in batch:
+            account_name = account['_params']['AccountName']
+            log.info(f"   {account['accountId']} ({account_name})")
+        batch_accounts = ', '.join(account['accountId'] for account in batch)
+        requeue = False
+        
+        try:
+            response = cf.create_stack_instances(
+                StackSetName=stackset_name,
+                Accounts=[account['accountId'] for account in batch],
+                Regions=batch[0]['regions'],
+                ParameterOverrides=batch[0]['parameters'],
+                OperationPreferences=preferences
+            )
+            
+            operation_id = response['OperationId']
+            log.info(f"✓ Operation initiated: {operation_id}")
+            
+            # Wait for operation to complete (with timeout)
+            log.info("⏳ Waiting for completion...")
+            status = wait_for_stackset_op(cf, stackset_name, operation_id)
+            if status in ['SUCCEEDED', 'FAILED', 'STOPPED']:
+                last_completed_op_id = operation_id
+            
+            if status == 'SUCCEEDED':
+                log.info(f"✅ Successfully deployed to {batch_accounts}")
+                existing_accounts.update(account['accountId'] for account in batch)
+                # Keep the queued batches consistent with what is now deployed
+                pending = _drop_deployed(pending, existing_accounts)
+            else:
+                if status in ['FAILED', 'STOPPED']:
+                    log.error(f"❌ Operation {status} for {batch_accounts}")
+                else:
+                    log.warning(f"⚠️ Timeout waiting for operation {operation_id}")
+                requeue = True
+            
+        except cf.exceptions.OperationInProgressException:
+            log.info("⏳ Another operation in progress - will retry...")
+            pending.appendleft((batch, retries))
+        except cf.exceptions.StackSetNotFoundException:
+            log.error(f"❌ StackSet {stackset_name} not found - exiting")
+            break
+        except Exception as e:
+            log.error(f"❌ Error: {e}")
+            requeue = True
+            time.sleep(30)
+        
+        if requeue:
+            # Resync before the retry so accounts that did succeed are not deployed again
+            last_sync = None
+            if retries < MAX_BATCH_RETRIES:
+                pending.append((batch, retries + 1))
+            else:
+                log.error(f"❌ Giving up on {batch_accounts} after {retries + 1} attempts")
+                given_up.extend(batch)
+        
+        # Brief pause before next iteration
+        time.sleep(10)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Deploy or update CloudFormation StackSet instances')
+    parser.add_argument('--update', action='store_true', help='Update existing stack instances instead of deploying new ones')
+    parser.add_argument('--account', type=str, help='Target specific account ID for update operation')
+    parser.add_argument('--update-params', action='store_true', help='Update parameters for all accounts (use with --update)')
+    parser.add_argument('--profile', type=str, default='Profile-admin', help='AWS profile name (default: Profile-admin)')
+    parser.add_argument('--stackset-name', type=str, default='Default-Stackname', help='StackSet name (default: Default-Stackname)')
+    parser.add_argument('--template', type=str, default='template.yaml', help='CloudFormation template file (default: template.yaml)')
+    parser.add_argument('--config', type=str, default='account-parameters.json', help='Account parameters config file (default: account-parameters.json)')
+    parser.add_argument('--max-concurrent', type=int, default=100, help='Maximum percentage of accounts deployed concurrently per region (default: 100)')
+    parser.add_argument('--failure-tolerance', type=int, default=10, help='Percentage of accounts per region allowed to fail before stopping (default: 10)')
+    parser.add_argument('--log-level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='Logging level (default: INFO)')
+    
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(message)s')
+    preferences = build_operation_preferences(args.max_concurrent, args.failure_tolerance)
+    
+    cf = get_cf(args.profile)
+    
+    if args.update:
+        # Load CloudFormation template
+        with open(args.template, 'r') as f:
+            template_body = f.read()
+        
+        # Create or update StackSet (template changes auto-propagate to instances)
+        template_updated = create_or_update_stackset(cf, args.stackset_name, template_body, preferences)
+        
+        # Update instances based on flags
+        if args.account or args.update_params:
+            config = load_config(args.config)
+            
+            if args.account:
+                log.info(f"🔄 Updating parameters for account: {args.account}")
+                update_stack_instances(cf, args.stackset_name, config, args.account, preferences)
+            elif args.update_params:
+                log.info("🔄 Updating parameters for all accounts...")
+                update_stack_instances(cf, args.stackset_name, config, preferences=preferences)
+        elif template_updated:
+            log.info("✅ Template updated - changes will propagate to all instances automatically")
+    else:
+        deploy_auto_loop(cf, args.stackset_name, args.template, args.config, preferences)
\ No newline at end of file